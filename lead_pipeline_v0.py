@@ -1,7 +1,7 @@
 """
 lead_pipeline_v0.py
 Single-file Lead Intelligence skeleton with Playwright cookie support + Google Sheets.
-- Install: pip install playwright gspread oauth2client beautifulsoup4 requests
+- Install: pip install playwright gspread google-auth selectolax 'httpx[http2]' diskcache
 - Playwright post-install: playwright install
 - Create GCP service account JSON and share your Sheet with the service account email
 - Create a Google Sheet with a "companies" worksheet and headers matching the `SHEET_COLUMNS`
@@ -11,25 +11,40 @@ Single-file Lead Intelligence skeleton with Playwright cookie support + Google S
 from dotenv import load_dotenv
 import os
 import time
+import asyncio
 import json
 import logging,sys
+import hashlib
+import functools
+import string
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
 from typing import Dict, Optional
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+import diskcache
 from pydantic import BaseModel
 from google import genai
 from google.genai import types
 from dataclasses import dataclass
 from pydantic import BaseModel, Field,HttpUrl, field_validator
-from typing import Optional, List, Literal
+from typing import Optional, List, Literal, get_origin
 from datetime import date
 
-# Playwright (sync API)
-from playwright.sync_api import sync_playwright, Page, Browser, TimeoutError as PlaywrightTimeout,Playwright, BrowserContext
+# Playwright (sync API for the one-off headful login, async API for the pipeline)
+from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright, Page, Browser, TimeoutError as PlaywrightTimeout,Playwright, BrowserContext
+
+# Optional: uvloop (libuv-based event loop) for lower per-socket overhead at high scrape fan-out
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Google Sheets
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import Request as GoogleAuthRequest
 
 # --- CONFIG ---
 
@@ -46,8 +61,31 @@ COMPANIES_SHEET_NAME = "companies"
 PLAYWRIGHT_STATE_FILE = "pw_storage_state.json"
 
 # Rate limits
-SHEET_SLEEP = 1.2
 HTTP_TIMEOUT = 15
+MIN_TEXT_LEN = 200  # scraped text shorter than this counts as a weak signal (Playwright fallback)
+MAX_HTML_BYTES = 256 * 1024  # stop downloading a page after this many (decompressed) bytes
+LLM_CONCURRENCY = 8  # max in-flight Gemini requests (keeps us under the RPM quota)
+PLAYWRIGHT_MAX_PAGES = 6  # max concurrently open Playwright pages
+PLAYWRIGHT_SETTLE_MS = 2000  # max wait for content to render after domcontentloaded
+
+# Requests aborted by the Playwright context (text scraping never needs them)
+PLAYWRIGHT_BLOCKED_RESOURCES = {"image", "media", "font", "stylesheet"}
+PLAYWRIGHT_BLOCKED_HOSTS = (
+    "googletagmanager.com", "google-analytics.com", "doubleclick.net",
+    "connect.facebook.net", "hotjar.com", "segment.io",
+)
+SCRAPE_CONCURRENCY = 6  # scraper workers in the pipeline
+PIPELINE_QUEUE_SIZE = 32  # bound on items buffered between pipeline stages
+WRITE_BATCH_SIZE = 20  # writer flushes to Sheets after this many rows...
+WRITE_FLUSH_S = 10.0  # ...or this many seconds after the first buffered row
+
+# Gemini
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+PROMPT_CACHE_TTL = "600s"  # lifetime of the cached ICP instruction block
+PROMPT_CACHE_MIN_TOKENS = 2048  # Gemini rejects context caches smaller than this
+LLM_HEDGE_AFTER_S = 8.0  # send a duplicate Gemini request if the first has not answered by then
+LLM_CACHE_DIR = ".llm_cache"
+LLM_CACHE_TTL = 7 * 86400  # seconds a cached Gemini analysis stays valid
 
 
 # Column ordering for the sheet (ensure your Sheet has these headers in the same order)
@@ -141,17 +179,47 @@ class Company_Profile(BaseModel):
             raise ValueError("Invalid Domain")
         return v
 
+# Built once at import; the schema never changes between Gemini calls.
+_COMPANY_PROFILE_SCHEMA = Company_Profile.model_json_schema()
+
 # --- SHEETS AUTH (gspread) ---
-def init_sheets():
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+# (creds, client, worksheet), authorized once per process and reused by every later get_ws() call
+_SHEETS_HANDLE = None
 
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(SERVICE_ACCOUNT_FILE,scope)
-    client = gspread.authorize(creds)
-    sheet = client.open(SHEET_NAME)
-    companies_ws = sheet.worksheet(COMPANIES_SHEET_NAME)
+def get_ws():
+    """
+    Return the companies worksheet, authorizing and opening the sheet only on first use.
+    The access token is refreshed only when it has expired, so repeated runs in one process
+    (daemon mode) skip the OAuth token fetch and the open/worksheet lookups.
+    """
+    global _SHEETS_HANDLE
+    if _SHEETS_HANDLE is None:
+        creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SHEETS_SCOPES)
+        client = gspread.authorize(creds)
+        sheet = client.open(SHEET_NAME)
+        companies_ws = sheet.worksheet(COMPANIES_SHEET_NAME)
+        _SHEETS_HANDLE = (creds, client, companies_ws)
+
+    creds, _, companies_ws = _SHEETS_HANDLE
+    if not creds.valid:
+        creds.refresh(GoogleAuthRequest())
     return companies_ws
 
 
+# --- HTML TEXT EXTRACTION ---
+def extract_text(html: str, selector: str = "p,li,h1,h2,h3") -> str:
+    """
+    Return visible text from the nodes matching `selector` (selectolax lexbor backend, C-backed parser).
+    Node.text() is deep, so script/style/noscript are stripped first; otherwise inline JS/CSS
+    inside a matched <li>/<p> would end up in the text.
+    """
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(["script", "style", "noscript"])
+    return " ".join(n.text(separator=" ", strip=True) for n in tree.css(selector))
+
+
 # --- PLAYWRIGHT HELPERS ---
 def ensure_playwright_storage_exists():
     """Create an empty storage file if none exists (first-time)."""
@@ -162,11 +230,24 @@ def ensure_playwright_storage_exists():
             logging.info(f"Created empty Playwright storage state: {PLAYWRIGHT_STATE_FILE}")
 
 
+# Parsed PLAYWRIGHT_STATE_FILE, read from disk once and handed to new_context() as a dict
+_STORAGE_STATE: Optional[dict] = None
+
+def load_storage_state() -> Optional[dict]:
+    """Return the saved storage state (cookies/localStorage), parsing the JSON file only on first use."""
+    global _STORAGE_STATE
+    if _STORAGE_STATE is None and os.path.exists(PLAYWRIGHT_STATE_FILE):
+        with open(PLAYWRIGHT_STATE_FILE) as f:
+            _STORAGE_STATE = json.load(f)
+    return _STORAGE_STATE
+
+
 def playwright_run_login_and_save_state(login_fn):
     """
     Run a headful browser so you can log in manually, then save storage state.
     Example: call this once to login to LinkedIn or another site.
     """
+    global _STORAGE_STATE
     ensure_playwright_storage_exists()
     with sync_playwright() as pw:
         browser = pw.chromium.launch(headless=False)# headful so you can interact
@@ -176,59 +257,128 @@ def playwright_run_login_and_save_state(login_fn):
         login_fn(page)# callback should perform navigation + wait until logged in
         # Wait a bit and let cookies settle
         time.sleep(2)
-        context.storage_state(path=PLAYWRIGHT_STATE_FILE)
+        _STORAGE_STATE = context.storage_state(path=PLAYWRIGHT_STATE_FILE)
         logging.info(f"Saved storage = state to {PLAYWRIGHT_STATE_FILE}")
         browser.close()
 
 
-def launch_playwright_browser(headless=True) -> tuple[Playwright, Browser, BrowserContext]:
+def is_blocked_host(url: str) -> bool:
+    """True if the URL's host is one of PLAYWRIGHT_BLOCKED_HOSTS or a subdomain of one."""
+    hostname = (urlsplit(url).hostname or "").lower()
+    return any(hostname == host or hostname.endswith("." + host) for host in PLAYWRIGHT_BLOCKED_HOSTS)
+
+async def block_heavy_resources(route):
+    """Route handler: abort resource types and tracker hosts that carry no page text."""
+    request = route.request
+    if request.resource_type in PLAYWRIGHT_BLOCKED_RESOURCES or is_blocked_host(request.url):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def launch_playwright_browser(pw: Playwright, headless=True) -> tuple[Browser, BrowserContext]:
     """
     Launch a Playwright browser context using saved storage state (cookies/localStorage).
+    The caller owns the lifetime: launch once per run and share the context across domains.
     Returns (browser, context)
     """ 
     ensure_playwright_storage_exists()
-    pw = sync_playwright().start()
-    browser = pw.chromium.launch(headless=headless)
+    browser = await pw.chromium.launch(headless=headless)
     # load storage state into context to preserve cookies/localStorage
-    context = browser.new_context(storage_state=PLAYWRIGHT_STATE_FILE if os.path.exists(PLAYWRIGHT_STATE_FILE) else None)
-    return pw,browser, context
+    context = await browser.new_context(storage_state=load_storage_state())
+    # we only read text, so skip images/fonts/CSS/trackers for every page in the context
+    await context.route("**/*", block_heavy_resources)
+    return browser, context
 
-def close_playwright(pw, browser):
+async def close_playwright(context, browser):
     try:
-        browser.close()
+        if context:
+            await context.close()
     except Exception:
         pass
     try:
-        pw.stop()
+        if browser:
+            await browser.close()
     except Exception:
         pass
 
-def scrape_with_playwright(domain: str, path: str = "/", timeout_s: int = 15) -> str:
+class PagePool:
     """
-    Return rendered page text (text from <p> and <li>) using Playwright context (with cookies).
+    Bounded pool of pages on one shared BrowserContext.
+    Playwright, the browser and the context are started on the first acquire(), so runs where
+    every domain scrapes fine over plain HTTP never launch Chromium.
+    At most `max_pages` pages are checked out at once; released pages are kept open and reused.
+    """
+    def __init__(self, max_pages: int = PLAYWRIGHT_MAX_PAGES):
+        self._slots = asyncio.Semaphore(max_pages)
+        self._launch_lock = asyncio.Lock()
+        self._idle: list[Page] = []
+        self._pw: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
+        self._launch_error: Optional[Exception] = None
+
+    async def _ensure_context(self) -> BrowserContext:
+        async with self._launch_lock:
+            if self.context is None:
+                if self._launch_error is not None:
+                    raise self._launch_error  # don't retry a failed Chromium launch for every domain
+                try:
+                    self._pw = await async_playwright().start()
+                    self._browser, self.context = await launch_playwright_browser(self._pw, headless=True)
+                except Exception as e:
+                    self._launch_error = e
+                    raise
+        return self.context
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self._slots:
+            context = await self._ensure_context()
+            page = self._idle.pop() if self._idle else await context.new_page()
+            try:
+                yield page
+            finally:
+                if not page.is_closed():
+                    self._idle.append(page)
+
+    async def close(self):
+        for page in self._idle:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._idle.clear()
+        await close_playwright(self.context, self._browser)
+        self.context, self._browser = None, None
+        if self._pw is not None:
+            try:
+                await self._pw.stop()
+            except Exception:
+                pass
+            self._pw = None
+
+async def scrape_with_playwright(pool: PagePool, domain: str, path: str = "/", timeout_s: int = 15) -> str:
+    """
+    Return rendered page text (text from <p> and <li>) using a pooled Playwright page (with cookies).
     Use this when the page needs JS or requires being logged in.
     """
     url = f"https://{domain.rstrip('/')}{path}"
-    pw,browser,context = None, None, None
     try:
-        pw,browser,context = launch_playwright_browser(headless=True)
-        page = context.new_page()
-        logging.info(f"[Playwright] Navigating to {url}")
-        try:
-            page.goto(url, wait_until="domcontentloaded", timeout=timeout_s * 1000)
-        except PlaywrightTimeout:
-            logging.warning(f"domcontentloaded timeout, trying networkidle")
-            page.goto(url, wait_until="networkidle", timeout=timeout_s * 1000)
-        time.sleep(2.0)
-       
-        content = page.content()
-        soup = BeautifulSoup(content, 'html.parser')
-
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-
-        text = " ".join(t.get_text(" ", strip=True) for t in soup.select("p,li"))
+        async with pool.acquire() as page:
+            logging.info(f"[Playwright] Navigating to {url}")
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=timeout_s * 1000)
+            except PlaywrightTimeout:
+                logging.warning(f"domcontentloaded timeout, trying networkidle")
+                await page.goto(url, wait_until="networkidle", timeout=timeout_s * 1000)
+            # short content-based wait instead of a fixed sleep: most pages render text well under this
+            try:
+                await page.locator("p, main, article").first.wait_for(timeout=PLAYWRIGHT_SETTLE_MS)
+            except PlaywrightTimeout:
+                pass
+
+            content = await page.content()
+        text = extract_text(content, "p,li")
         return text[:10000] # cap
     
     except PlaywrightTimeout as e:
@@ -238,81 +388,79 @@ def scrape_with_playwright(domain: str, path: str = "/", timeout_s: int = 15) ->
     except Exception as e:
         logging.error(f"Playwright scrape error {url}: {e}")
         return ""
-    
-    finally:
-        if context:
-            try:
-                context.close()
-            except Exception:
-                pass
-        if browser:
-            try:
-                browser.close()
-            except Exception:
-                pass
-        if pw:
-            try:
-                pw.stop()
-            except Exception:
-                pass
         
-# --- STATIC SCRAPER FALLBACK (requests + BeautifulSoup) ---       
-def scrape_with_requests(domain: str, path: str = "/") -> str:
-    url = f"https://{domain.rstrip('/')}{path}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate",
-        "Connection": "keep-alive",
-    }
-    try:
-        r = requests.get(url, timeout=HTTP_TIMEOUT, headers=headers,allow_redirects=True)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-
-        # Remove script and style elements
-        for script in soup(["script","style"]):
-            script.decompose()
-
-
+# --- STATIC SCRAPER FALLBACK (httpx + selectolax) ---       
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate",
+}
 
+def new_http_client() -> httpx.AsyncClient:
+    """
+    One pooled HTTP/2 client per run: connections (and TLS sessions) are reused across paths
+    and domains. Created and closed by main(), so every run gets a fresh client.
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        headers=DEFAULT_HEADERS,
+        follow_redirects=True,
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    )
 
-        text = " ".join(t.get_text(" ",strip=True) for t in soup.select("p,li,h1,h2,h3"))
+async def scrape_with_httpx(http: httpx.AsyncClient, domain: str, path: str = "/") -> str:
+    url = f"https://{domain.rstrip('/')}{path}"
+    try:
+        # stream and stop at MAX_HTML_BYTES: we only keep 10k chars of text, so the tail of
+        # multi-MB pages is never downloaded or parsed
+        async with http.stream("GET", url) as r:
+            r.raise_for_status()
+            body = bytearray()
+            async for chunk in r.aiter_bytes(chunk_size=8192):
+                body += chunk
+                if len(body) >= MAX_HTML_BYTES:
+                    break
+            html = body[:MAX_HTML_BYTES].decode(r.encoding or "utf-8", errors="replace")
+        text = extract_text(html)
         return text[:10000]
-    except requests.Timeout:
+    except httpx.TimeoutException:
         logging.warning(f"Timeout for {url}")
         return ""
-    except requests.RequestException as e:
-        logging.warning(f"requests failed for {url}: {e}")
+    except httpx.HTTPError as e:
+        logging.warning(f"HTTP fetch failed for {url}: {e}")
         return ""
     
 
+async def scrape_first_useful(http: httpx.AsyncClient, domain: str, paths: tuple[str, ...] = ("/about", "/")) -> str:
+    """
+    Fetch all `paths` concurrently (hedged). Returns the first text of at least MIN_TEXT_LEN chars
+    and cancels the other fetches; if none is long enough, returns the longest one.
+    """
+    tasks = [asyncio.create_task(scrape_with_httpx(http, domain, p)) for p in paths]
+    best = ""
+    try:
+        for fut in asyncio.as_completed(tasks):
+            text = await fut
+            if len(text) >= MIN_TEXT_LEN:
+                return text
+            if len(text) > len(best):
+                best = text
+        return best
+    finally:
+        for t in tasks:
+            t.cancel()
+    
+
 def to_row(self):
     """Return a list of values matching SHEET_COLUMNS order."""
     return [getattr(self,col,"") for col in SHEET_COLUMNS]
     
 # --- LLM STUB (replace with your model call) ---
-
-def llm_icp_analysis(company_name: str, today: str) -> Dict:
-    from dotenv import load_dotenv
-    from google.genai import types
-
-    load_dotenv()  # ensures .env values are loaded even if run standalone
-    API_KEY = os.getenv("GEMINI_API_KEY")
-    
-
-    if not API_KEY:
-        logging.error("GEMINI_API_KEY missing")
-        return {}
-  
-    logging.info("Gemini key present: True")
-
-    logging.info(f"Loaded key: {API_KEY[:6]}...")
-    schema = Company_Profile.model_json_schema()
-    client = genai.Client(api_key=API_KEY)
-
-    user_prompt = f""" System / Instruction:
+# Static instruction block, identical for every company. Stored once as a Gemini context cache
+# (see create_prompt_cache) so per-request tokens only cover the short task suffix below.
+ICP_SYSTEM_PROMPT = """ System / Instruction:
     You are assisting with institutional user discovery for an AI trading platform targeting mid-market funds. 
     -Return ONLY JSON that validates against the provided response_schema. 
     -Actively use Google Search when facts are missing (AUM, HQ city/country, team size, recent news).
@@ -330,30 +478,176 @@ def llm_icp_analysis(company_name: str, today: str) -> Dict:
     - Tech maturity: using or trialing algorithmic trading/AI/quant platforms.
     - Geography: US, UK, EU, Canada.
 
-    Task:
-    Determine if “{company_name}” should be contacted during user-discovery and craft a personalised 1-2 sentence outreach snippet based on RECENT public activity (prefer < 12 months).Today is {today}.
-    Score 0–100 and classify as High/Medium/Low based on ICP alignment and recency/strength of activity.
-
     Output policy:
     - Be precise, concise, non-promotional.
-    - Use ISO dates (YYYY-MM-DD) for first_seen/last_seen ({today} for last_seen).
+    - Use ISO dates (YYYY-MM-DD) for first_seen/last_seen (today's date for last_seen).
     - ‘recent_activity’ (< 12 months).
     - ‘summary’ (2-4 sentences).
     - ‘outreach_snippet’ personalised message,should be engaging and should reference 'sources'.
 
     """
+
+# Per-company part of the prompt, filled in per request.
+ICP_TASK_PROMPT = string.Template(""" Task:
+    Determine if “$company_name” should be contacted during user-discovery and craft a personalised 1-2 sentence outreach snippet based on RECENT public activity (prefer < 12 months).Today is $today.
+    Score 0–100 and classify as High/Medium/Low based on ICP alignment and recency/strength of activity.
+    Use $today for last_seen.
+
+    """)
+
+# Fingerprint of everything that shapes a Gemini answer; any prompt or schema edit changes it,
+# which retires the old entries in LLM_CACHE_DIR.
+PROMPT_VERSION = hashlib.sha256(
+    (ICP_SYSTEM_PROMPT + ICP_TASK_PROMPT.template + json.dumps(_COMPANY_PROFILE_SCHEMA, sort_keys=True)).encode()
+).hexdigest()[:16]
+
+# --- LLM RESPONSE CACHE (on disk, keyed by model + prompt version + company) ---
+_llm_cache = diskcache.Cache(LLM_CACHE_DIR)
+_llm_cache_stats = {"hits": 0, "misses": 0}
+
+def disk_cached_analysis(fn):
+    """
+    Serve repeat analyses of the same company from LLM_CACHE_DIR for LLM_CACHE_TTL seconds.
+    Empty (failed) results are not cached.
+    """
+    @functools.wraps(fn)
+    async def wrapper(company_name: str, today: str, *args, **kwargs) -> Dict:
+        key = hashlib.sha256(f"{GEMINI_MODEL}|{PROMPT_VERSION}|{company_name}".encode()).hexdigest()
+        cached = _llm_cache.get(key)
+        if cached is not None:
+            _llm_cache_stats["hits"] += 1
+            logging.info(f"LLM cache hit for {company_name}")
+            return cached
+
+        _llm_cache_stats["misses"] += 1
+        result = await fn(company_name, today, *args, **kwargs)
+        if result:
+            _llm_cache.set(key, result, expire=LLM_CACHE_TTL)
+        return result
+    return wrapper
+
+def close_llm_cache():
+    logging.info(f"LLM cache: {_llm_cache_stats['hits']} hit(s), {_llm_cache_stats['misses']} miss(es)")
+    _llm_cache.close()
+
+# Shared Gemini client: one httpx pool / keep-alive connection set for every request in the run.
+_GEMINI_CLIENT: Optional[genai.Client] = None
+
+def init_gemini_client() -> Optional[genai.Client]:
+    """Create the shared Gemini client once (validating GEMINI_API_KEY); later calls return it."""
+    global _GEMINI_CLIENT
+    if _GEMINI_CLIENT is not None:
+        return _GEMINI_CLIENT
+
+    load_dotenv()  # ensures .env values are loaded even if run standalone
+    API_KEY = os.getenv("GEMINI_API_KEY")
+    if not API_KEY:
+        logging.error("GEMINI_API_KEY missing")
+        return None
+
+    _GEMINI_CLIENT = genai.Client(api_key=API_KEY)
+    return _GEMINI_CLIENT
+
+async def close_gemini_client():
+    global _GEMINI_CLIENT
+    if _GEMINI_CLIENT is not None:
+        try:
+            await _GEMINI_CLIENT.aio.aclose()
+        except Exception:
+            pass
+        _GEMINI_CLIENT = None
+
+async def create_prompt_cache() -> Optional[str]:
+    """
+    Store ICP_SYSTEM_PROMPT as an explicit Gemini context cache and return its name.
+    Returns None if caching is unavailable; callers then send the instruction block inline.
+    A prompt below PROMPT_CACHE_MIN_TOKENS (estimated locally at ~4 chars/token) is never sent,
+    since Gemini would reject it. The cache expires on its own after PROMPT_CACHE_TTL.
+    """
+    est_tokens = len(ICP_SYSTEM_PROMPT) // 4
+    if est_tokens < PROMPT_CACHE_MIN_TOKENS:
+        logging.info(f"ICP prompt ~{est_tokens} tokens, below cache minimum {PROMPT_CACHE_MIN_TOKENS}; sending inline")
+        return None
+
+    client = init_gemini_client()
+    if client is None:
+        return None
+
+    try:
+        cache = await client.aio.caches.create(
+            model=GEMINI_MODEL,
+            config=types.CreateCachedContentConfig(
+                system_instruction=ICP_SYSTEM_PROMPT,
+                ttl=PROMPT_CACHE_TTL,
+            ))
+        logging.info(f"Created Gemini prompt cache {cache.name}")
+        return cache.name
+    except Exception as e:
+        logging.warning(f"Gemini prompt cache unavailable, sending prompt inline: {e}")
+        return None
+
+async def generate_content_hedged(client: genai.Client, contents: str, config: types.GenerateContentConfig,
+                                  llm_slots: asyncio.Semaphore):
+    """
+    Call Gemini; if no answer within LLM_HEDGE_AFTER_S, fire one duplicate request and return
+    whichever succeeds first (the other is cancelled). Trims the latency tail of a batch.
+    Raises the last error if both attempts fail.
+    The caller holds one llm_slots slot for the primary; the hedge needs a second free slot
+    and is skipped otherwise, so LLM_CONCURRENCY still caps in-flight requests.
+    """
+    def attempt():
+        return asyncio.create_task(client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=config))
+
+    primary = attempt()
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=LLM_HEDGE_AFTER_S)
+        if done:
+            return primary.result()
+
+        if llm_slots.locked():
+            logging.info(f"Gemini call slower than {LLM_HEDGE_AFTER_S}s, no free slot for a hedge request")
+            return await primary
+
+        logging.info(f"Gemini call slower than {LLM_HEDGE_AFTER_S}s, sending hedge request")
+        await llm_slots.acquire()  # free slot checked above, so this does not wait
+        hedge = attempt()
+        hedge.add_done_callback(lambda _: llm_slots.release())
+        pending.add(hedge)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not pending:
+                raise task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+
+@disk_cached_analysis
+async def llm_icp_analysis_async(company_name: str, today: str, llm_slots: asyncio.Semaphore,
+                                 cache_name: Optional[str] = None) -> Dict:
+    client = init_gemini_client()
+    if client is None:
+        return {}
+
+    task_prompt = ICP_TASK_PROMPT.substitute(company_name=company_name, today=today)
     try:
         config = types.GenerateContentConfig(
             response_mime_type="application/json",
-            response_schema=schema,
+            response_schema=_COMPANY_PROFILE_SCHEMA,
             temperature=0.2,
+            cached_content=cache_name,
         )
+        # with a context cache only the task is billed as fresh input; otherwise send the instruction block inline
+        user_prompt = task_prompt if cache_name else ICP_SYSTEM_PROMPT + task_prompt
         
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-lite", 
-            contents=user_prompt,
-            config=config)
-        client.close()
+        async with llm_slots:
+            response = await generate_content_hedged(client, user_prompt, config, llm_slots)
 
         if response.parsed:
                 parsed = response.parsed
@@ -368,64 +662,89 @@ def llm_icp_analysis(company_name: str, today: str) -> Dict:
             
     except Exception as e:
         logging.error(f"LLM analysis failed for {company_name}: {e}")
-        client.close()
         return {}
 
 
 
 
-def get_seen_domains(ws) -> set[str]:
-    idx = SHEET_COLUMNS.index("domain") + 1
-    vals = ws.col_values(idx)[1:]
-    return {v.strip().lower() for v in vals}
-    
-# --- SHEETS WRITER (append/update) ---
-def save_company_row(ws,row_dict: dict[str, object]) -> None:
+# A1 range of the domain column below the header row, e.g. "B2:B"
+_DOMAIN_COL = gspread.utils.rowcol_to_a1(1, SHEET_COLUMNS.index("domain") + 1).rstrip("1")
+DOMAIN_RANGE = f"{_DOMAIN_COL}2:{_DOMAIN_COL}"
+
+def get_seen_domains(ws) -> frozenset[str]:
+    """Read the domain column once (data rows only). Immutable, so it can be shared between coroutines."""
+    vals = ws.get(DOMAIN_RANGE, value_render_option="UNFORMATTED_VALUE")
+    return frozenset(str(v[0]).strip().lower() for v in vals if v)
+
+# Row layout resolved once at import: (column, is_list) per SHEET_COLUMNS entry. List columns
+# come from Company_Profile's List[...] fields (currently just `sources`), so build_row needs no
+# per-value isinstance checks.
+_LIST_COLUMNS = {name for name, field in Company_Profile.model_fields.items() if get_origin(field.annotation) is list}
+_ROW_SPEC = tuple((col, col in _LIST_COLUMNS) for col in SHEET_COLUMNS)
+
+def build_row(row_dict: dict[str, object]) -> list:
+    """Return a list of values matching SHEET_COLUMNS order, lists joined as comma-separated strings."""
+    return [
+        ", ".join(str(v) for v in row_dict.get(col) or []) if is_list else row_dict.get(col, "")
+        for col, is_list in _ROW_SPEC
+    ]
+
+# --- SHEETS WRITER (batched append) ---
+def save_company_rows(ws, row_dicts: list[dict[str, object]], seen: set[str]) -> None:
     """
-    Append-only mode (simple). If you want upsert behavior, call get_seen_domains and update logic.
+    Append-only mode (simple). Rows whose domain is already in `seen` (or earlier in the batch)
+    are skipped, the rest go to the sheet in a single append_rows call.
+    `seen` is the writer's copy of the domains fetched once by main(); it is updated in place
+    after a successful append, so the sheet's domain column never has to be re-read.
     """
-    # Build row following SHEET_COLUMNS
-  
-    existing_domains = get_seen_domains(ws)
-    domain = (row_dict.get("domain") or "").strip().lower()
-    if domain in existing_domains:
-        raise ValueError(f"Row for Domain: {domain} already exists")
-
-    # Build row following SHEET_COLUMNS, converting lists to comma-separated strings
-    row = []
-    for col in SHEET_COLUMNS:
-        value = row_dict.get(col, "")
-        # Convert lists to comma-separated strings for sheets
-        if isinstance(value, list):
-            value = ", ".join(str(v) for v in value)
-        row.append(value)
-
-    ws.append_row(row, value_input_option="RAW")
-    time.sleep(SHEET_SLEEP)
-    logging.info(f"Appended row for {row_dict.get('domain','<none>')}")
+    rows = []
+    new_domains = set()
+    for row_dict in row_dicts:
+        domain = (row_dict.get("domain") or "").strip().lower()
+        if domain in seen or domain in new_domains:
+            logging.warning(f"Row for Domain: {domain} already exists, skipping")
+            continue
+        new_domains.add(domain)
+        rows.append(build_row(row_dict))
+
+    if not rows:
+        logging.info("No new rows to append")
+        return
+
+    ws.append_rows(rows, value_input_option="RAW")
+    seen.update(new_domains)
+    logging.info(f"Appended {len(rows)} row(s)")
 
 # --- MAIN PROCESSING FLOW ---
-def process_domain(domain: str, ws):  
+async def scrape_domain(http: httpx.AsyncClient, domain: str, pool: PagePool) -> tuple[str, bool]:
     """
-    Orchestration for a single domain:
-    - Try requests scrape first (fast)
-    - If result empty or dynamic site suspected, run Playwright
-    - Run LLM analysis (stub)
-    - Save row to sheet
+    Scrape a single domain:
+    - Try plain HTTP scrape first (fast, pooled httpx client; /about and / fetched concurrently)
+    - If result empty or dynamic site suspected, run Playwright on a pooled page
+    Returns (text, used_playwright).
     """
-    logging.info(f"Processing {domain}")
-    about_text = scrape_with_requests(domain, "/about") or scrape_with_requests(domain, "/")
+    about_text = await scrape_first_useful(http, domain, ("/about", "/"))
     used_playwright = False
-    if not about_text or len(about_text) < 200:
+    if len(about_text) < MIN_TEXT_LEN:
         # fallback to Playwright for rendered JS or protected content
         logging.info("Falling back to Playwright for rendered content")
-        about_text = scrape_with_playwright(domain, "/")
+        about_text = await scrape_with_playwright(pool, domain, "/")
         used_playwright = True
-    
-    today = time.strftime("%Y-%m-%d")
-    analysis = llm_icp_analysis(domain, today)
+    return about_text, used_playwright
+
+async def process_domain(domain: str, used_playwright: bool, today: str, llm_slots: asyncio.Semaphore,
+                         cache_name: Optional[str] = None) -> dict[str, object]:
+    """
+    Analysis step for a single, already scraped domain:
+    - Run LLM analysis (async, bounded by LLM_CONCURRENCY)
+    - Return the row dict (the writer stage appends rows in batches)
+    """
+    logging.info(f"Processing {domain}")
+    analysis = await llm_icp_analysis_async(domain, today, llm_slots, cache_name)
     if not analysis:
         raise RuntimeError("LLM analysis returned empty result (check API key/model).")
+    # the LLM cache ignores the date, so a hit may carry an older run's dates
+    analysis = {**analysis, "last_seen": today, "first_seen": analysis.get("first_seen") or today}
 
     row = {
     "company_name": analysis.get("company_name", domain.split(".")[0].title()),
@@ -448,28 +767,122 @@ def process_domain(domain: str, ws):
     "first_seen": analysis.get("first_seen", today),
     "last_seen": analysis.get("last_seen", today)
 }
-    save_company_row(ws, row)
+    return row
+
+# --- PIPELINE STAGES (scrape -> analyze -> write, connected by bounded queues) ---
+async def scraper(domain_q: asyncio.Queue, text_q: asyncio.Queue, http: httpx.AsyncClient, pool: PagePool):
+    while (domain := await domain_q.get()) is not None:
+        try:
+            about_text, used_playwright = await scrape_domain(http, domain, pool)
+        except Exception as e:
+            logging.warning(f"Scrape failed for {domain}: {e}")
+            about_text, used_playwright = "", False
+        await text_q.put((domain, about_text, used_playwright))
+
+async def analyzer(text_q: asyncio.Queue, row_q: asyncio.Queue, today: str, llm_slots: asyncio.Semaphore,
+                   cache_name: Optional[str]):
+    while (item := await text_q.get()) is not None:
+        domain, about_text, used_playwright = item
+        try:
+            await row_q.put(await process_domain(domain, used_playwright, today, llm_slots, cache_name))
+        except Exception as e:
+            logging.error(f"Failed processing {domain}: {e}")
+
+async def writer(row_q: asyncio.Queue, ws, seen: frozenset[str]):
+    """
+    Coalesce rows and append them every WRITE_BATCH_SIZE rows or WRITE_FLUSH_S seconds
+    (whichever comes first), plus a final flush when the analyzers are done.
+    """
+    known = set(seen)  # writer-owned copy, grown as rows are appended
+    loop = asyncio.get_running_loop()
+    batch, flush_at, done = [], None, False
+    while not done:
+        timeout = None if flush_at is None else max(0.0, flush_at - loop.time())
+        try:
+            row = await asyncio.wait_for(row_q.get(), timeout)
+            if row is None:
+                done = True
+            else:
+                if not batch:
+                    flush_at = loop.time() + WRITE_FLUSH_S
+                batch.append(row)
+        except asyncio.TimeoutError:
+            pass
+
+        if batch and (done or len(batch) >= WRITE_BATCH_SIZE or loop.time() >= flush_at):
+            try:
+                # gspread is blocking; keep the event loop free for the other stages
+                await asyncio.to_thread(save_company_rows, ws, batch, known)
+            except Exception as e:
+                logging.error(f"Failed writing {len(batch)} row(s): {e}")
+            batch, flush_at = [], None
 
 # --- Simple CLI-style main ---
-def main():
+async def main():
     logging.info("Starting pipeline…")
     domains = ["aspectcapital.com","aqr.com"]
-    ws = init_sheets()
+    ws = get_ws()
     seen = get_seen_domains(ws)
 
+    unseen = []
     for d in domains:
         if d in seen:
             logging.info(f"Skipping {d} (already seen)")
             continue 
+        unseen.append(d)
+
+    if not unseen:
+        logging.info("No new domains to process")
+        return
+
+    today = time.strftime("%Y-%m-%d")
+    if init_gemini_client() is None:
+        logging.error("Gemini client unavailable; not scraping since every analysis would fail")
+        return
+    cache_name = await create_prompt_cache()
+    # created per run: a semaphore binds to the loop it first waits on, so it cannot outlive main()
+    llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+    async with new_http_client() as http:
+        pool = PagePool(max_pages=PLAYWRIGHT_MAX_PAGES)
+        stage_tasks = []
         try:
-            process_domain(d,ws)
-        except Exception as e:
-            logging.error(f"Failed processing {d}: {e}")
+            domain_q = asyncio.Queue()
+            text_q = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            row_q = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+            scrapers = [asyncio.create_task(scraper(domain_q, text_q, http, pool)) for _ in range(SCRAPE_CONCURRENCY)]
+            analyzers = [asyncio.create_task(analyzer(text_q, row_q, today, llm_slots, cache_name)) for _ in range(LLM_CONCURRENCY)]
+            writer_task = asyncio.create_task(writer(row_q, ws, seen))
+            stage_tasks = [*scrapers, *analyzers, writer_task]
+
+            # each stage ends on a None sentinel per worker, sent once the previous stage has drained
+            for d in unseen:
+                domain_q.put_nowait(d)
+            for _ in scrapers:
+                domain_q.put_nowait(None)
+            await asyncio.gather(*scrapers)
+            for _ in analyzers:
+                await text_q.put(None)
+            await asyncio.gather(*analyzers)
+            await row_q.put(None)
+            await writer_task
+        finally:
+            # on error/interrupt, stop every stage before the resources they use are closed
+            for task in stage_tasks:
+                task.cancel()
+            await asyncio.gather(*stage_tasks, return_exceptions=True)
+            await pool.close()
+            await close_gemini_client()
              
 if __name__ == "__main__":
     try:
         logging.info("Entrypoint reached — calling main()")
-        main()
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except Exception:
         logging.exception("Unhandled exception in main")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        close_llm_cache()
\ No newline at end of file
@@ -0,0 +1,207 @@
+import asyncio
+
+import pytest
+
+pipeline = pytest.importorskip("lead_pipeline_v0")
+
+
+def test_extract_text_skips_inline_script_and_style():
+    html = (
+        "<ul>"
+        '<li>Home<script>window.dataLayer=[];gtag("config","X")</script></li>'
+        "<li><style>.a{color:red}</style>About us</li>"
+        "</ul>"
+        "<p>We build<noscript>enable JS</noscript> trading systems.</p>"
+    )
+    assert pipeline.extract_text(html) == "Home About us We build trading systems."
+
+
+def test_extract_text_uses_selector():
+    html = "<h1>Title</h1><p>Body</p><div>Ignored</div>"
+    assert pipeline.extract_text(html) == "Title Body"
+    assert pipeline.extract_text(html, "p,li") == "Body"
+
+
+def test_page_pool_launches_lazily_and_once(monkeypatch):
+    starts = []
+
+    class FailingPlaywright:
+        async def start(self):
+            starts.append(1)
+            raise RuntimeError("chromium missing")
+
+    monkeypatch.setattr(pipeline, "async_playwright", FailingPlaywright)
+
+    async def run():
+        pool = pipeline.PagePool(max_pages=2)
+        assert starts == []  # nothing launched until a page is needed
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                async with pool.acquire():
+                    pass
+        await pool.close()
+
+    asyncio.run(run())
+    assert starts == [1]
+
+
+class _FakeModels:
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config):
+        delay = self.delays[self.calls]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        return f"response-{self.calls}"
+
+
+class _FakeClient:
+    def __init__(self, delays):
+        self.aio = type("Aio", (), {})()
+        self.aio.models = _FakeModels(delays)
+
+
+@pytest.mark.parametrize("slots, expected, calls", [(2, "response-2", 2), (1, "response-1", 1)])
+def test_hedge_only_uses_a_free_concurrency_slot(monkeypatch, slots, expected, calls):
+    monkeypatch.setattr(pipeline, "LLM_HEDGE_AFTER_S", 0.05)
+    client = _FakeClient([0.3, 0.01])
+
+    async def run():
+        sem = asyncio.Semaphore(slots)
+        async with sem:  # the caller's slot for the primary request
+            result = await pipeline.generate_content_hedged(client, "prompt", None, sem)
+        await asyncio.sleep(0)
+        for _ in range(slots):  # every slot, including the hedge's, is free again
+            assert not sem.locked()
+            await sem.acquire()
+        return result
+
+    assert asyncio.run(run()) == expected
+    assert client.aio.models.calls == calls
+
+
+class _FakeProfileModels:
+    """Slow enough that the first analysis hedges and the second analyzer has to wait for a slot."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config):
+        self.calls += 1
+        await asyncio.sleep(0.2)
+        profile = {
+            "company_name": "Fake", "domain": f"fake{self.calls}.com", "summary": "s",
+            "fit_reasoning": "r", "fit_score": 3, "fit_class": "Low", "outreach_snippet": "o", "sources": [],
+        }
+        return type("Response", (), {"parsed": profile, "text": None})()
+
+
+class _FakeWorksheet:
+    def __init__(self):
+        self.rows = []
+        self.appends = []
+
+    def append_rows(self, rows, value_input_option):
+        self.rows.extend(rows)
+        self.appends.append([row[pipeline.SHEET_COLUMNS.index("domain")] for row in rows])
+
+
+def test_main_can_run_twice(monkeypatch):
+    client = type("Client", (), {})()
+    client.aio = type("Aio", (), {})()
+    client.aio.models = _FakeProfileModels()
+    ws = _FakeWorksheet()
+
+    async def fake_scrape_domain(http, domain, pool):
+        await asyncio.sleep(0.05 if domain == "aqr.com" else 0)
+        return "about text", False
+
+    async def no_prompt_cache():
+        return None
+
+    cache = type("Cache", (), {"get": lambda self, key: None, "set": lambda self, key, value, expire: None})()
+    monkeypatch.setattr(pipeline, "_llm_cache", cache)
+    monkeypatch.setattr(pipeline, "get_ws", lambda: ws)
+    monkeypatch.setattr(pipeline, "get_seen_domains", lambda ws: frozenset())
+    monkeypatch.setattr(pipeline, "init_gemini_client", lambda: client)
+    monkeypatch.setattr(pipeline, "create_prompt_cache", no_prompt_cache)
+    monkeypatch.setattr(pipeline, "scrape_domain", fake_scrape_domain)
+    monkeypatch.setattr(pipeline, "LLM_CONCURRENCY", 2)
+    monkeypatch.setattr(pipeline, "LLM_HEDGE_AFTER_S", 0.01)
+
+    for _ in range(2):  # each run gets its own event loop
+        asyncio.run(pipeline.main())
+    assert len(ws.rows) == 4
+
+
+def test_writer_flushes_on_size_deadline_and_sentinel(monkeypatch):
+    monkeypatch.setattr(pipeline, "WRITE_BATCH_SIZE", 3)
+    monkeypatch.setattr(pipeline, "WRITE_FLUSH_S", 0.1)
+    ws = _FakeWorksheet()
+
+    async def run():
+        row_q = asyncio.Queue()
+        task = asyncio.create_task(pipeline.writer(row_q, ws, frozenset({"old.com"})))
+
+        # size: the third row fills the batch; the duplicates are dropped from it
+        for domain in ["a.com", "a.com", "old.com"]:
+            await row_q.put({"domain": domain})
+        await asyncio.sleep(0.05)
+        assert ws.appends == [["a.com"]]
+
+        # deadline: a lone row is written once WRITE_FLUSH_S has passed
+        await row_q.put({"domain": "b.com"})
+        await asyncio.sleep(0.05)
+        assert len(ws.appends) == 1
+        await asyncio.sleep(0.1)
+        assert ws.appends[-1] == ["b.com"]
+
+        # sentinel: whatever is buffered is written straight away; already written domains stay skipped
+        await row_q.put({"domain": "c.com"})
+        await row_q.put({"domain": "b.com"})
+        await row_q.put(None)
+        await asyncio.wait_for(task, 0.05)
+
+    asyncio.run(run())
+    assert ws.appends == [["a.com"], ["b.com"], ["c.com"]]
+
+
+@pytest.mark.parametrize("row_dict, sources", [
+    ({"domain": "aqr.com", "sources": ["https://aqr.com", "https://aqr.com/about"]},
+     "https://aqr.com, https://aqr.com/about"),
+    ({"domain": "aqr.com", "sources": []}, ""),
+    ({"domain": "aqr.com"}, ""),
+])
+def test_build_row_joins_list_columns(row_dict, sources):
+    row = pipeline.build_row(row_dict)
+    assert len(row) == len(pipeline.SHEET_COLUMNS)
+    assert row[pipeline.SHEET_COLUMNS.index("sources")] == sources
+    assert row[pipeline.SHEET_COLUMNS.index("domain")] == "aqr.com"
+    assert row[pipeline.SHEET_COLUMNS.index("hq_city")] == ""
+
+
+def test_get_seen_domains_reads_domain_column_once():
+    calls = []
+
+    class FakeWs:
+        def get(self, range_name, value_render_option):
+            calls.append(range_name)
+            return [["AQR.com "], [], [123]]  # the API drops trailing empty cells, so blank rows come back as []
+
+    assert pipeline.DOMAIN_RANGE == "B2:B"
+    assert pipeline.get_seen_domains(FakeWs()) == frozenset({"aqr.com", "123"})
+    assert calls == ["B2:B"]
+
+
+@pytest.mark.parametrize("url, blocked", [
+    ("https://www.googletagmanager.com/gtm.js?id=X", True),
+    ("https://cdn.segment.io/analytics.js", True),
+    ("https://segment.io/", True),
+    ("https://example.com/blog/why-we-left-segment.io", False),
+    ("https://example.com/?ref=doubleclick.net", False),
+    ("https://notsegment.io/", False),
+])
+def test_is_blocked_host_matches_hostname_only(url, blocked):
+    assert pipeline.is_blocked_host(url) is blocked